@@ -2,17 +2,100 @@
 """
 Add lat/lon to peers.json by geolocating IPs via ip-api.com batch API.
 Free tier: 15 req/min for single, but batch endpoint handles 100 IPs per request.
+
+Results are cached in geo_cache.json (next to peers.json) so repeat runs only
+query IPs that are new or whose cached entry is older than CACHE_TTL.
 """
 
+import http.client
 import json
+import threading
 import time
-import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from urllib.parse import urlsplit
+
+from json_io import write_json
 
 PEERS_PATH = Path(__file__).parent / "static" / "data" / "peers.json"
+CACHE_PATH = PEERS_PATH.parent / "geo_cache.json"
+CACHE_TTL = 30 * 24 * 3600  # re-fetch cached entries older than 30 days
 BATCH_URL = "http://ip-api.com/batch"
 BATCH_SIZE = 100  # max per request
-RATE_LIMIT_PAUSE = 1.5  # seconds between batch requests
+BATCH_RATE_LIMIT = 15  # batch requests per window, before X-Rl tells us otherwise
+RATE_LIMIT_MARGIN = 0.2  # extra seconds to wait past X-Ttl
+MAX_CONCURRENT_BATCHES = 4  # batch requests allowed in flight at once
+MAX_RETRIES = 3  # retries per batch on connection errors or HTTP 429
+RETRY_BACKOFF = 0.5  # seconds, doubled on each retry
+
+
+class RateLimit:
+    """ip-api quota shared by all worker threads, kept in sync via X-Rl/X-Ttl."""
+
+    def __init__(self, limit: int):
+        self._lock = threading.Lock()
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def acquire(self):
+        """Take one request from the quota, sleeping until reset if it's used up."""
+        with self._lock:
+            if self.remaining <= 0:
+                wait = self.reset_at - time.monotonic()
+                if wait > 0:
+                    print(f"    Rate limit reached, waiting {wait:.1f}s")
+                    time.sleep(wait)
+                self.remaining = self.limit
+            self.remaining -= 1
+
+    def update(self, remaining: int, ttl: int):
+        with self._lock:
+            # Other threads may have requests in flight that the server hasn't
+            # counted yet, so never raise our local count
+            self.remaining = min(self.remaining, remaining)
+            self.reset_at = time.monotonic() + ttl + RATE_LIMIT_MARGIN
+
+
+# One keep-alive connection per worker thread, reused across batches
+_local = threading.local()
+_rate_limit = RateLimit(BATCH_RATE_LIMIT)
+
+
+def _connection() -> http.client.HTTPConnection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = http.client.HTTPConnection(urlsplit(BATCH_URL).netloc, timeout=10)
+        _local.conn = conn
+    return conn
+
+
+def _post_json(payload: bytes) -> list:
+    """POST payload to BATCH_URL over this thread's persistent connection."""
+    path = urlsplit(BATCH_URL).path
+    for attempt in range(MAX_RETRIES + 1):
+        _rate_limit.acquire()
+        conn = _connection()
+        try:
+            conn.request("POST", path, body=payload, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            body = resp.read()
+            remaining, ttl = resp.getheader("X-Rl"), resp.getheader("X-Ttl")
+            if remaining is not None and ttl is not None:
+                _rate_limit.update(int(remaining), int(ttl))
+            if resp.status == 429 and attempt < MAX_RETRIES:
+                _rate_limit.update(0, int(ttl or 60))
+                continue
+            if resp.status != 200:
+                raise http.client.HTTPException(f"HTTP {resp.status} {resp.reason}")
+            return json.loads(body)
+        except (http.client.HTTPException, OSError):
+            # Server may have dropped the idle socket; reconnect and retry
+            conn.close()
+            _local.conn = None
+            if attempt == MAX_RETRIES:
+                raise
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
 
 
 def geolocate_batch(ips: list[str]) -> dict[str, dict]:
@@ -22,14 +105,8 @@ def geolocate_batch(ips: list[str]) -> dict[str, dict]:
         for ip in ips
     ]).encode()
 
-    req = urllib.request.Request(
-        BATCH_URL,
-        data=payload,
-        headers={"Content-Type": "application/json"},
-    )
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            results = json.loads(resp.read())
+        results = _post_json(payload)
     except Exception as e:
         print(f"    Batch request failed: {e}")
         return {}
@@ -48,9 +125,39 @@ def geolocate_batch(ips: list[str]) -> dict[str, dict]:
     return out
 
 
+def geolocate_all(batches: list[list[str]]):
+    """Run batches concurrently, yielding (batch, results) as each completes.
+
+    Requests only wait when ip-api reports the quota is exhausted; see RateLimit.
+    """
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_BATCHES) as pool:
+        futures = {pool.submit(geolocate_batch, batch): batch for batch in batches}
+        for fut in as_completed(futures):
+            yield futures[fut], fut.result()
+
+
+def load_geo_cache() -> dict[str, dict]:
+    """Load {ip: geo} from CACHE_PATH, dropping entries older than CACHE_TTL."""
+    if not CACHE_PATH.exists():
+        return {}
+    try:
+        with open(CACHE_PATH, encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  Ignoring unreadable geo cache: {e}")
+        return {}
+
+    cutoff = time.time() - CACHE_TTL
+    return {ip: geo for ip, geo in cache.items() if geo.get("fetched_at", 0) >= cutoff}
+
+
+def save_geo_cache(cache: dict[str, dict]):
+    write_json(CACHE_PATH, cache)
+
+
 def main():
     print("Loading peers.json...")
-    with open(PEERS_PATH) as f:
+    with open(PEERS_PATH, encoding="utf-8") as f:
         peers = json.load(f)
 
     # Collect unique IPs
@@ -61,20 +168,24 @@ def main():
             ip_to_peers.setdefault(ip, []).append(pubkey)
 
     unique_ips = list(ip_to_peers.keys())
-    print(f"  {len(unique_ips)} unique IPs to geolocate")
-
-    # Batch geolocate
-    geo_cache = {}
-    batches = [unique_ips[i:i + BATCH_SIZE] for i in range(0, len(unique_ips), BATCH_SIZE)]
-
-    for i, batch in enumerate(batches):
-        print(f"  Batch {i + 1}/{len(batches)} ({len(batch)} IPs)...")
-        results = geolocate_batch(batch)
+    geo_cache = load_geo_cache()
+    missing = [ip for ip in unique_ips if ip not in geo_cache]
+    print(f"  {len(unique_ips)} unique IPs, {len(unique_ips) - len(missing)} cached, {len(missing)} to geolocate")
+
+    # Batch geolocate only the IPs we don't have yet
+    batches = [missing[i:i + BATCH_SIZE] for i in range(0, len(missing), BATCH_SIZE)]
+
+    for i, (batch, results) in enumerate(geolocate_all(batches)):
+        print(f"  Batch {i + 1}/{len(batches)} done ({len(results)}/{len(batch)} IPs)")
+        fetched_at = int(time.time())
+        for geo in results.values():
+            geo["fetched_at"] = fetched_at
         geo_cache.update(results)
-        if i < len(batches) - 1:
-            time.sleep(RATE_LIMIT_PAUSE)
 
-    print(f"  Geolocated {len(geo_cache)}/{len(unique_ips)} IPs")
+    if batches:
+        save_geo_cache(geo_cache)
+    located = sum(1 for ip in unique_ips if ip in geo_cache)
+    print(f"  Geolocated {located}/{len(unique_ips)} IPs")
 
     # Enrich peers
     enriched = 0
@@ -93,8 +204,7 @@ def main():
     print(f"  Enriched {enriched} peers with geolocation")
 
     # Write back
-    with open(PEERS_PATH, "w") as f:
-        json.dump(peers, f)
+    write_json(PEERS_PATH, peers, gz=True)
     print(f"  Written to {PEERS_PATH}")
 
 
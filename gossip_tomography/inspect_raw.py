@@ -13,15 +13,25 @@ BOLT 7 channel_announcement wire format (after zeroed sigs):
 
 The raw column stores the full message with signatures zeroed out.
 """
-import json
-import base64
+import os
+import struct
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain
+from multiprocessing import get_context
 from pathlib import Path
 
 import polars as pl
 
+from json_io import write_json
+
 REPO_ROOT = Path(__file__).resolve().parent.parent
 PARQUET_DIR = REPO_ROOT / "data" / "mainnet" / "gossip_archives" / "dump_0926T195046"
+# Parsed node_announcements from earlier runs over the same dump, keyed by
+# message hash; delete it after changing parse_node_announcement
+PARSED_CACHE_PATH = PARQUET_DIR / "parsed_node_anns.parquet"
+PARALLEL_MIN_ROWS = 20_000  # below this, process start-up costs more than it saves
 
 # BOLT 9 feature bit definitions
 FEATURE_BITS = {
@@ -63,118 +73,187 @@ FEATURE_BITS = {
     51: "zero_conf",
 }
 
-
-def decode_raw(raw_str: str) -> bytes:
-    padding = (4 - len(raw_str) % 4) % 4
-    return base64.urlsafe_b64decode(raw_str + "=" * padding)
+# bit -> (feature name, compulsory/optional) for the low bits seen in practice;
+# higher bits fall back to computing the entry on the fly
+_BIT_TABLE_SIZE = 64
+_BIT_TABLE = [
+    (FEATURE_BITS.get(bit, f"unknown_bit_{bit}"), "compulsory" if bit % 2 == 0 else "optional")
+    for bit in range(_BIT_TABLE_SIZE)
+]
+
+# Fixed-size fields, unpacked in one C call each
+_FLEN = struct.Struct(">H")
+# timestamp(4) + node_id(33) + rgb(3) + alias(32) + addrlen(2)
+_NODE_BODY = struct.Struct(">I33s3s32sH")
+# chain_hash(32) + scid(8) + node1(33) + node2(33)
+_CHAN_BODY = struct.Struct(">32sQ33s33s")
+# Address descriptors: type code -> name, and payload size for fixed-size types
+_ADDR_TYPES = {1: "ipv4", 2: "ipv6", 3: "torv2", 4: "torv3", 5: "dns"}
+_ADDR_SIZES = {1: 6, 2: 18, 3: 12, 4: 37}
+
+
+def decode_raw_col(col: str = "raw") -> pl.Expr:
+    """Decode the stored URL-safe, possibly unpadded base64 str -> binary."""
+    std = pl.col(col).str.replace_many(["-", "_"], ["+", "/"])
+    padded = std.str.pad_end((std.str.len_bytes() + 3) // 4 * 4, "=")
+    return padded.str.decode("base64")
+
+
+def node_announcement_headers(df: pl.DataFrame) -> pl.DataFrame:
+    """Extract flen/timestamp/node_id columns from decoded node_announcements.
+
+    Rows too short to hold the fixed-size fields are dropped. Mirrors the
+    offsets used by parse_node_announcement.
+    """
+    flen = pl.col("raw_b").bin.slice(0, 2).bin.reinterpret(dtype=pl.UInt16, endianness="big")
+    ts_off = pl.col("flen").cast(pl.Int64) + 2
+    return (
+        df.with_columns(flen=flen)
+        .filter(pl.col("raw_b").bin.size() >= ts_off + 4 + 33 + 3 + 32 + 2)
+        .with_columns(
+            timestamp=pl.col("raw_b").bin.slice(ts_off, 4).bin.reinterpret(dtype=pl.UInt32, endianness="big"),
+            node_id=pl.col("raw_b").bin.slice(ts_off + 4, 33).bin.encode("hex"),
+        )
+    )
+
+
+@dataclass(slots=True)
+class NodeAnn:
+    """Parsed node_announcement fields used by the fingerprinting pass."""
+    node_id: str
+    alias: str
+    timestamp: int
+    flen: int
+    features_hex: str
+    addr_types: tuple[str, ...]
 
 
 def decode_features(feat_bytes: bytes) -> dict:
     """Decode feature bit vector into named features."""
-    feat_int = int.from_bytes(feat_bytes, "big") if feat_bytes else 0
+    return decode_feature_mask(int.from_bytes(feat_bytes, "big") if feat_bytes else 0)
+
+
+def decode_feature_mask(feat_int: int) -> dict:
+    """Decode an integer feature bitmask into named features."""
     features = {}
-    bit = 0
     val = feat_int
-    while val > 0:
-        if val & 1:
-            name = FEATURE_BITS.get(bit, f"unknown_bit_{bit}")
-            kind = "compulsory" if bit % 2 == 0 else "optional"
-            features[name] = kind
-        val >>= 1
-        bit += 1
+    while val:
+        # Isolate the lowest set bit so zero runs are skipped entirely
+        lsb = val & -val
+        bit = lsb.bit_length() - 1
+        if bit < _BIT_TABLE_SIZE:
+            name, kind = _BIT_TABLE[bit]
+        else:
+            name, kind = f"unknown_bit_{bit}", "compulsory" if bit % 2 == 0 else "optional"
+        features[name] = kind
+        val ^= lsb
     return features
 
 
-def parse_node_announcement(raw: bytes) -> dict | None:
+def parse_node_announcement(raw: bytes) -> NodeAnn | None:
     """Parse a node_announcement from raw bytes (sig STRIPPED, not zeroed).
     
     Stored format: flen(2) + features(flen) + timestamp(4) + node_id(33)
                    + rgb(3) + alias(32) + addrlen(2) + addresses(addrlen)
     """
-    if len(raw) < 2 + 4 + 33 + 3 + 32 + 2:
+    if len(raw) < _FLEN.size + _NODE_BODY.size:
         return None
 
     off = 0  # sig is NOT in the stored bytes
-    flen = int.from_bytes(raw[off:off+2], "big")
-    off += 2
-    if off + flen + 4 + 33 + 3 + 32 + 2 > len(raw):
+    (flen,) = _FLEN.unpack_from(raw, off)
+    off += _FLEN.size
+    if off + flen + _NODE_BODY.size > len(raw):
         return None
 
     features = raw[off:off+flen]
     off += flen
-    timestamp = int.from_bytes(raw[off:off+4], "big")
-    off += 4
-    node_id = raw[off:off+33].hex()
-    off += 33
-    rgb = raw[off:off+3].hex()
-    off += 3
-    alias = raw[off:off+32].rstrip(b"\x00").decode("utf-8", errors="replace")
-    off += 32
-    addrlen = int.from_bytes(raw[off:off+2], "big")
-    off += 2
+    timestamp, node_id, _rgb, alias, addrlen = _NODE_BODY.unpack_from(raw, off)
+    off += _NODE_BODY.size
     addr_bytes = raw[off:off+addrlen]
 
-    # Parse addresses
-    addresses = parse_addresses(addr_bytes)
-
-    return {
-        "node_id": node_id,
-        "alias": alias,
-        "rgb": f"#{rgb}",
-        "timestamp": timestamp,
-        "flen": flen,
-        "features_hex": features.hex() if features else "",
-        "features": decode_features(features),
-        "addresses": addresses,
-        "addr_types": [a["type"] for a in addresses],
-    }
-
-
-def parse_addresses(data: bytes) -> list:
-    """Parse BOLT 7 address descriptors."""
-    addrs = []
+    return NodeAnn(
+        node_id=node_id.hex(),
+        alias=alias.rstrip(b"\x00").decode("utf-8", errors="replace"),
+        timestamp=timestamp,
+        flen=flen,
+        features_hex=features.hex(),
+        addr_types=parse_address_types(addr_bytes),
+    )
+
+
+def _parse_node_chunk(raws: list[bytes]) -> list[NodeAnn | None]:
+    return [parse_node_announcement(raw) for raw in raws]
+
+
+def parse_node_announcements(raws: list[bytes]) -> list[NodeAnn | None]:
+    """Parse many node_announcements, split across CPU cores for large inputs."""
+    workers = os.cpu_count() or 1
+    if workers == 1 or len(raws) < PARALLEL_MIN_ROWS:
+        return _parse_node_chunk(raws)
+
+    size = -(-len(raws) // workers)
+    chunks = [raws[i:i + size] for i in range(0, len(raws), size)]
+    # spawn rather than fork: forking a process that has Polars' thread pool running can deadlock
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        return list(chain.from_iterable(pool.map(_parse_node_chunk, chunks)))
+
+
+def node_anns_to_frame(hashes: list, nodes: list[NodeAnn]) -> pl.DataFrame:
+    """Tabulate parsed nodes for the on-disk cache (features kept as hex)."""
+    return pl.DataFrame({
+        "hash": hashes,
+        "node_id": [n.node_id for n in nodes],
+        "alias": [n.alias for n in nodes],
+        "timestamp": [n.timestamp for n in nodes],
+        "flen": [n.flen for n in nodes],
+        "features_hex": [n.features_hex for n in nodes],
+        "addr_types": [list(n.addr_types) for n in nodes],
+    }, schema_overrides={"addr_types": pl.List(pl.String)})
+
+
+def node_anns_from_frame(df: pl.DataFrame) -> list[NodeAnn]:
+    return [
+        NodeAnn(
+            node_id=node_id,
+            alias=alias,
+            timestamp=timestamp,
+            flen=flen,
+            features_hex=features_hex,
+            addr_types=tuple(addr_types),
+        )
+        for node_id, alias, timestamp, flen, features_hex, addr_types in zip(
+            *(df[c].to_list() for c in ("node_id", "alias", "timestamp", "flen", "features_hex", "addr_types"))
+        )
+    ]
+
+
+def iter_address_descriptors(data: bytes):
+    """Yield (addr_type, start, end) for each BOLT 7 address descriptor.
+
+    Stops at the first unknown type or truncated descriptor.
+    """
     off = 0
-    while off < len(data):
+    end = len(data)
+    while off < end:
         addr_type = data[off]
         off += 1
-        if addr_type == 1:  # IPv4
-            if off + 6 > len(data):
-                break
-            ip = ".".join(str(b) for b in data[off:off+4])
-            port = int.from_bytes(data[off+4:off+6], "big")
-            addrs.append({"type": "ipv4", "addr": f"{ip}:{port}"})
-            off += 6
-        elif addr_type == 2:  # IPv6
-            if off + 18 > len(data):
-                break
-            ip = ":".join(f"{data[off+i]:02x}{data[off+i+1]:02x}" for i in range(0, 16, 2))
-            port = int.from_bytes(data[off+16:off+18], "big")
-            addrs.append({"type": "ipv6", "addr": f"[{ip}]:{port}"})
-            off += 18
-        elif addr_type == 3:  # Tor v2 (deprecated)
-            if off + 12 > len(data):
-                break
-            addrs.append({"type": "torv2", "addr": "torv2"})
-            off += 12
-        elif addr_type == 4:  # Tor v3
-            if off + 37 > len(data):
-                break
-            addrs.append({"type": "torv3", "addr": "torv3_onion"})
-            off += 37
-        elif addr_type == 5:  # DNS hostname
-            if off + 1 > len(data):
-                break
-            hlen = data[off]
-            off += 1
-            if off + hlen + 2 > len(data):
-                break
-            hostname = data[off:off+hlen].decode("utf-8", errors="replace")
-            port = int.from_bytes(data[off+hlen:off+hlen+2], "big")
-            addrs.append({"type": "dns", "addr": f"{hostname}:{port}"})
-            off += hlen + 2
+        if addr_type == 5:  # DNS hostname: hlen(1) + hostname(hlen) + port(2)
+            if off + 1 > end:
+                return
+            size = 1 + data[off] + 2
         else:
-            break  # unknown type, stop
-    return addrs
+            size = _ADDR_SIZES.get(addr_type)
+            if size is None:
+                return  # unknown type, stop
+        if off + size > end:
+            return
+        yield addr_type, off, off + size
+        off += size
+
+
+def parse_address_types(data: bytes) -> tuple[str, ...]:
+    """Address type names of each BOLT 7 descriptor."""
+    return tuple(_ADDR_TYPES[addr_type] for addr_type, _, _ in iter_address_descriptors(data))
 
 
 def parse_channel_announcement(raw: bytes) -> dict | None:
@@ -186,22 +265,18 @@ def parse_channel_announcement(raw: bytes) -> dict | None:
     if len(raw) < 2 + 32 + 8 + 33*4:
         return None
     off = 0  # sigs are stripped
-    flen = int.from_bytes(raw[off:off+2], "big")
-    off += 2
+    (flen,) = _FLEN.unpack_from(raw, off)
+    off += _FLEN.size
     features = raw[off:off+flen]
     off += flen
-    chain_hash = raw[off:off+32].hex()
-    off += 32
-    scid = int.from_bytes(raw[off:off+8], "big")
-    off += 8
-    node1 = raw[off:off+33].hex()
-    off += 33
-    node2 = raw[off:off+33].hex()
+    if off + _CHAN_BODY.size > len(raw):
+        return None
+    _chain_hash, scid, node1, node2 = _CHAN_BODY.unpack_from(raw, off)
 
     return {
         "scid": scid,
-        "node1": node1,
-        "node2": node2,
+        "node1": node1.hex(),
+        "node2": node2.hex(),
         "flen": flen,
         "features_hex": features.hex() if features else "",
         "features": decode_features(features),
@@ -213,39 +288,99 @@ def main():
     print("  GOSSIP MESSAGE RAW DECODER — Feature Fingerprinting")
     print("=" * 60)
 
-    msgs = pl.read_parquet(str(PARQUET_DIR / "messages.parquet/"))
-    meta = pl.read_parquet(str(PARQUET_DIR / "metadata.parquet/"))
-    joined = msgs.join(meta.select("hash", "type", "orig_node", "size"), on="hash", how="inner")
+    # Lazy scan so only the needed columns are read and the type filter is
+    # pushed below the join. The streaming engine doesn't preserve input
+    # order, so carry the file row and sort back on it: "first seen" wins
+    # every tie below, as when the dump was read eagerly.
+    msgs = pl.scan_parquet(str(PARQUET_DIR / "messages.parquet/"), row_index_name="row").select("row", "hash", "raw")
+    meta = pl.scan_parquet(str(PARQUET_DIR / "metadata.parquet/")).select("hash", "type", "orig_node", "size")
+    joined = (
+        msgs.join(meta, on="hash", how="inner")
+        .filter(pl.col("type").is_in([1, 2]))
+        .collect(engine="streaming")
+        .sort("row")
+    )
 
     # ── NODE ANNOUNCEMENTS ──────────────────────────────────────
     node_anns = joined.filter(pl.col("type") == 2)
     print(f"\n[1] Node announcements: {len(node_anns):,}")
 
-    parsed_nodes = {}
-    parse_errors = 0
-    for row in node_anns.iter_rows(named=True):
-        raw = decode_raw(row["raw"])
-        result = parse_node_announcement(raw)
+    # Drop repeated payloads (same announcement relayed under several
+    # hashes), decode and pull the fixed-offset header fields columnarly,
+    # then keep only the latest announcement per node before parsing in Python.
+    # The first relay of a payload is kept, so its hash (the cache key) is
+    # the same on every run over the same dump; copies counts the rows it
+    # stands for, so parse errors are still counted per announcement
+    unique_anns = node_anns.group_by("orig_node", "raw", maintain_order=True).agg(
+        pl.all().first(), pl.len().alias("copies")
+    )
+    headers = node_announcement_headers(unique_anns.with_columns(raw_b=decode_raw_col()))
+    latest = (
+        headers.with_columns(first_seen=pl.col("row").min().over("node_id"))
+        .sort(["timestamp", "row"], descending=[True, False])
+        .unique(subset="node_id", keep="first", maintain_order=True)
+        .sort("first_seen")
+    )
+    print(f"  {len(unique_anns):,} distinct payloads, {len(latest):,} latest-per-node")
+
+    # Reuse nodes parsed by a previous run; only new hashes go through Python
+    cached = pl.read_parquet(PARSED_CACHE_PATH) if PARSED_CACHE_PATH.exists() else None
+    if cached is not None:
+        hits = cached.join(latest.select("hash"), on="hash", how="semi")
+        to_parse = latest.join(cached.select("hash"), on="hash", how="anti")
+    else:
+        hits = None
+        to_parse = latest
+
+    parsed_by_hash = {}
+    if hits is not None:
+        parsed_by_hash.update(zip(hits["hash"].to_list(), node_anns_from_frame(hits)))
+    parse_errors = len(node_anns) - headers["copies"].sum()
+    new_hashes, new_nodes = [], []
+    parsed = parse_node_announcements(to_parse["raw_b"].to_list())
+    for h, copies, result in zip(to_parse["hash"], to_parse["copies"], parsed):
         if result:
-            # Keep latest per node (highest timestamp)
-            nid = result["node_id"]
-            if nid not in parsed_nodes or result["timestamp"] > parsed_nodes[nid]["timestamp"]:
-                parsed_nodes[nid] = result
+            parsed_by_hash[h] = result
+            new_hashes.append(h)
+            new_nodes.append(result)
         else:
-            parse_errors += 1
+            parse_errors += copies
 
-    print(f"  Parsed: {len(parsed_nodes)} unique nodes, {parse_errors} errors")
+    # Same node order whether a node came from the cache or was just parsed
+    parsed_nodes = {}
+    for h in latest["hash"].to_list():
+        if (node := parsed_by_hash.get(h)) is not None:
+            parsed_nodes[node.node_id] = node
+
+    print(f"  Parsed: {len(parsed_nodes)} unique nodes ({len(new_nodes)} new, "
+          f"{len(parsed_nodes) - len(new_nodes)} cached), {parse_errors} errors")
+
+    if new_nodes:
+        fresh = node_anns_to_frame(new_hashes, new_nodes)
+        if hits is not None:
+            fresh = pl.concat([hits, fresh], how="vertical_relaxed")
+        fresh.write_parquet(PARSED_CACHE_PATH)
+
+    # Group nodes by feature vector in Polars, so Python only decodes each
+    # distinct vector once; prevalence is then weighted by group size.
+    # Groups keep first-seen node order and the ranking sort is stable, so
+    # equal-sized groups and equal counts come out the same on every run
+    groups = (
+        latest.with_columns(features_hex=pl.col("raw_b").bin.slice(2, pl.col("flen")).bin.encode("hex"))
+        .group_by("features_hex", maintain_order=True)
+        .agg(pl.col("node_id"), pl.len().alias("node_count"))
+    )
+    fprint = groups.sort("node_count", descending=True, maintain_order=True)
+    ranked_groups = list(zip(fprint["features_hex"].to_list(), fprint["node_id"].to_list()))
+    fhex_to_features = {fhex: decode_features(bytes.fromhex(fhex)) for fhex in groups["features_hex"].to_list()}
+    fhex_to_names = {fhex: sorted(features) for fhex, features in fhex_to_features.items()}
 
     # Feature statistics
     feat_counter = Counter()
-    flen_counter = Counter()
-    addr_type_counter = Counter()
-    for n in parsed_nodes.values():
-        for feat_name in n["features"]:
-            feat_counter[feat_name] += 1
-        flen_counter[n["flen"]] += 1
-        for at in n["addr_types"]:
-            addr_type_counter[at] += 1
+    for fhex, count in zip(groups["features_hex"].to_list(), groups["node_count"].to_list()):
+        feat_counter.update(dict.fromkeys(fhex_to_features[fhex], count))
+    flen_counter = Counter(n.flen for n in parsed_nodes.values())
+    addr_type_counter = Counter(chain.from_iterable(n.addr_types for n in parsed_nodes.values()))
 
     print(f"\n  Feature bit prevalence (across {len(parsed_nodes)} nodes):")
     for feat, count in feat_counter.most_common(30):
@@ -266,13 +401,12 @@ def main():
 
     chan_feat_counter = Counter()
     chan_parse_ok = 0
-    for row in chan_anns.head(10000).iter_rows(named=True):
-        raw = decode_raw(row["raw"])
+    chan_sample = chan_anns.unique(subset="raw", maintain_order=True).head(10000)
+    for raw in chan_sample.select(raw_b=decode_raw_col())["raw_b"]:
         result = parse_channel_announcement(raw)
         if result:
             chan_parse_ok += 1
-            for feat_name in result["features"]:
-                chan_feat_counter[feat_name] += 1
+            chan_feat_counter.update(result["features"].keys())
 
     print(f"  Parsed: {chan_parse_ok}")
     if chan_feat_counter:
@@ -285,18 +419,11 @@ def main():
     # ── FINGERPRINT GROUPS ──────────────────────────────────────
     print(f"\n[3] Implementation fingerprinting...")
 
-    # Group by feature vector
-    fprint_groups = {}
-    for nid, n in parsed_nodes.items():
-        key = n["features_hex"]
-        fprint_groups.setdefault(key, []).append(nid)
-
-    print(f"  Unique feature fingerprints: {len(fprint_groups)}")
+    print(f"  Unique feature fingerprints: {len(ranked_groups)}")
     print(f"  Top 15 fingerprint groups:")
-    for fhex, nodes in sorted(fprint_groups.items(), key=lambda x: -len(x[1]))[:15]:
-        feats = decode_features(bytes.fromhex(fhex)) if fhex else {}
-        feat_names = sorted(set(feats.keys()))
-        sample_aliases = [parsed_nodes[n]["alias"] for n in nodes[:3]]
+    for fhex, nodes in ranked_groups[:15]:
+        feat_names = fhex_to_names[fhex]
+        sample_aliases = [parsed_nodes[n].alias for n in nodes[:3]]
         print(f"    [{len(nodes):4d} nodes]  flen={len(fhex)//2:3d}  features: {', '.join(feat_names[:6]) or '(none)'}")
         print(f"              samples: {', '.join(sample_aliases)}")
 
@@ -306,21 +433,20 @@ def main():
         "fingerprint_groups": [
             {
                 "features_hex": fhex,
-                "feature_names": sorted(set(decode_features(bytes.fromhex(fhex)).keys())) if fhex else [],
+                "feature_names": fhex_to_names[fhex],
                 "node_count": len(nodes),
                 "sample_nodes": nodes[:5],
                 "all_nodes": nodes,
             }
-            for fhex, nodes in sorted(fprint_groups.items(), key=lambda x: -len(x[1]))
+            for fhex, nodes in ranked_groups
         ],
-        "total_unique_fingerprints": len(fprint_groups),
+        "total_unique_fingerprints": len(ranked_groups),
         "total_nodes_parsed": len(parsed_nodes),
     }
 
     out_path = Path(__file__).resolve().parent / "static" / "data" / "fingerprints.json"
-    with open(out_path, "w") as f:
-        json.dump(output, f)
-    print(f"\n  Saved fingerprints.json ({len(fprint_groups)} groups)")
+    write_json(out_path, output, gz=True)
+    print(f"\n  Saved fingerprints.json ({len(ranked_groups)} groups)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+"""JSON output shared by the gossip_tomography scripts."""
+
+import gzip
+import json
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def write_json(path: Path, obj, indent: bool = False, gz: bool = False):
+    """
+    Write JSON (compact unless indent), via orjson when it's installed.
+
+    With gz, a gzipped copy goes next to it (peers.json.gz) for the server to
+    send to clients that accept gzip encoding. Without gz, a .gz left there
+    by an earlier write is removed; the server checks for it on every request,
+    so gzip clients then get the new plain file instead of the old copy.
+    """
+    if orjson is not None:
+        data = orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else None)
+    elif indent:
+        data = json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    else:
+        data = json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+    gz_path = Path(f"{path}.gz")
+    if gz:
+        with open(gz_path, "wb") as f:
+            f.write(gzip.compress(data, compresslevel=6, mtime=0))
+    else:
+        gz_path.unlink(missing_ok=True)
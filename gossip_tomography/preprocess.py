@@ -14,11 +14,14 @@ Outputs static JSON files consumed by the browser frontend.
 import json
 import os
 import time
-from ipaddress import ip_address
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from socket import AF_INET6, inet_pton
 
 import polars as pl
 
+from json_io import write_json
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -26,6 +29,15 @@ REPO_ROOT = Path(__file__).resolve().parent.parent
 PARQUET_DIR = REPO_ROOT / "data" / "mainnet" / "gossip_archives" / "dump_0926T195046"
 NODE_LIST_FILE = REPO_ROOT / "query_results" / "data" / "full_node_list.txt"
 OUTPUT_DIR = Path(__file__).resolve().parent / "static" / "data"
+JSON_WRITERS = 4
+
+# The streaming engine runs the ranking window in morsels with a smaller
+# working set, but isn't always faster; opt in with POLARS_STREAMING=1
+SCORES_ENGINE = "streaming" if os.environ.get("POLARS_STREAMING") == "1" else "in-memory"
+
+# Dotted-quad IPv4 as accepted by ipaddress (no leading zeros)
+_OCTET = r"(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9])"
+IPV4_RE = rf"^{_OCTET}(?:\.{_OCTET}){{3}}$"
 
 # Message types
 MSG_TYPES = {1: "channel_announcement", 2: "node_announcement", 3: "channel_update"}
@@ -106,37 +118,17 @@ KNOWN_HUBS = {
 }
 
 
-def is_clearnet(addr: str) -> bool:
-    """Check if address is a clearnet IP."""
-    try:
-        if addr.startswith("["):
-            idx = addr.rfind("]")
-            if idx != -1:
-                addr = addr[1:idx]
-        else:
-            idx = addr.rfind(":")
-            if idx != -1:
-                addr = addr[:idx]
-        ip_address(addr)
-        return True
-    except ValueError:
+def is_ipv6(host: str) -> bool:
+    """Check if host is an IPv6 literal."""
+    # inet_pton doesn't take the %zone suffix that ipaddress allows
+    host, sep, zone = host.partition("%")
+    if sep and (not zone or "%" in zone):
         return False
-
-
-def extract_ip(addr: str) -> str | None:
-    """Extract IP from address:port string."""
     try:
-        if addr.startswith("["):
-            idx = addr.rfind("]")
-            if idx != -1:
-                return addr[1:idx]
-        else:
-            idx = addr.rfind(":")
-            if idx != -1:
-                return addr[:idx]
-    except Exception:
-        pass
-    return None
+        inet_pton(AF_INET6, host)
+    except (OSError, ValueError):
+        return False
+    return True
 
 
 def load_nodes() -> dict:
@@ -144,141 +136,163 @@ def load_nodes() -> dict:
     with open(NODE_LIST_FILE) as f:
         nodes = json.load(f)
 
-    node_map = {}
+    pubkeys, aliases, addr_lists = [], [], []
     for n in nodes:
-        pubkey = n["pubkey"]
         info = n.get("info", {})
-        addresses = info.get("addresses", []) if info else []
-        alias = info.get("alias", "") if info else ""
-
-        clearnet_ip = None
-        for addr in addresses:
-            if is_clearnet(addr):
-                clearnet_ip = extract_ip(addr)
-                break
+        pubkeys.append(n["pubkey"])
+        aliases.append(info.get("alias", "") if info else "")
+        addr_lists.append(info.get("addresses", []) if info else [])
+
+    node_idx = pl.DataFrame({"addr": addr_lists}, schema={"addr": pl.List(pl.String)}).with_row_index("node")
+
+    addr = pl.col("addr")
+    addrs = node_idx.explode("addr").filter(addr.is_not_null()).with_columns(
+        # IP of [host]:port or host:port, null if there is no port
+        pl.when(addr.str.starts_with("["))
+        .then(addr.str.extract(r"^\[(.*)\]"))
+        .otherwise(addr.str.extract(r"^(.*):"))
+        .alias("ip")
+    ).with_columns(pl.col("ip").fill_null(addr).alias("host"))
+
+    host = pl.col("host")
+    v6_candidates = addrs.filter(host.str.contains(":", literal=True))["host"].unique().to_list()
+    v6_hosts = [h for h in v6_candidates if is_ipv6(h)]
+    per_node = node_idx.select("node").join(
+        addrs.group_by("node").agg(
+            pl.col("ip").filter(host.str.contains(IPV4_RE) | host.is_in(v6_hosts)).first().alias("clearnet_ip"),
+            addr.str.contains("onion", literal=True).all().alias("is_tor_only"),
+        ),
+        on="node",
+        how="left",
+        maintain_order="left",
+    ).with_columns(pl.col("is_tor_only").fill_null(True))
 
+    node_map = {}
+    for pubkey, alias, addresses, clearnet_ip, is_tor_only in zip(
+        pubkeys, aliases, addr_lists, per_node["clearnet_ip"], per_node["is_tor_only"]
+    ):
         node_map[pubkey] = {
             "alias": alias,
             "addresses": addresses,
             "clearnet_ip": clearnet_ip,
-            "is_tor_only": all("onion" in a for a in addresses) if addresses else True,
+            "is_tor_only": is_tor_only,
         }
     return node_map
 
 
-def compute_first_responder_scores(timings: pl.DataFrame) -> pl.DataFrame:
+def compute_first_responder_scores(timings: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame:
     """
     For each message, compute each peer's arrival percentile (0.0 = first, 1.0 = last).
     Then average across all messages to get a per-peer "first responder" score.
 
     Lower score = consistently early = topologically central or well-connected.
     """
-    print("  Computing per-message arrival ranks...")
+    print(f"  Ranking arrivals and aggregating per-peer scores ({SCORES_ENGINE} engine)...")
     t0 = time.time()
 
-    # For each message: compute rank of each peer by recv_timestamp
-    ranked = timings.with_columns(
-        pl.col("recv_timestamp")
-        .rank("ordinal")
-        .over("hash")
-        .alias("arrival_rank"),
-        pl.col("recv_timestamp")
-        .count()
-        .over("hash")
-        .alias("total_peers_for_msg"),
-    ).with_columns(
-        ((pl.col("arrival_rank") - 1) / (pl.col("total_peers_for_msg") - 1).clip(lower_bound=1))
-        .alias("arrival_percentile")
+    # For each message: rank of each peer by arrival time. After one sort by
+    # (hash, ts_ns, file_row) each message is a contiguous run of rows, so the
+    # ordinal rank and peer count come from a single sequential scan for the
+    # run boundaries instead of hashing every row into an .over("hash") window.
+    # file_row gives equal timestamps the first-read-ranks-first order.
+    row = pl.int_range(pl.len(), dtype=pl.Int64)
+    msg = pl.col("hash")
+    first_row = pl.when(msg.ne_missing(msg.shift(1))).then(row).forward_fill()
+    last_row = pl.when(msg.ne_missing(msg.shift(-1))).then(row).backward_fill()
+    ranked = timings.lazy().sort("hash", "ts_ns", "file_row").with_columns(
+        (row - first_row + 1).alias("arrival_rank"),
+        (last_row - first_row + 1).alias("total_peers_for_msg"),
     )
 
-    print(f"    Ranked {len(ranked):,} rows in {time.time()-t0:.1f}s")
-
     # Average percentile per peer across all messages
-    print("  Aggregating per-peer scores...")
-    t0 = time.time()
+    # Percentile is only evaluated inside the aggregation, never stored per row
+    rank_0 = pl.col("arrival_rank") - 1
+    last_rank_0 = (pl.col("total_peers_for_msg") - 1).clip(lower_bound=1)
+    percentile = rank_0 / last_rank_0
     scores = ranked.group_by("recv_peer").agg(
-        pl.col("arrival_percentile").mean().alias("avg_arrival_pct"),
-        pl.col("arrival_percentile").median().alias("median_arrival_pct"),
-        pl.col("arrival_percentile").std().alias("std_arrival_pct"),
+        percentile.mean().alias("avg_arrival_pct"),
+        percentile.median().alias("median_arrival_pct"),
+        percentile.std().alias("std_arrival_pct"),
         pl.len().alias("messages_seen"),
-        # How often was this peer in the top 5%?
-        (pl.col("arrival_percentile") < 0.05).sum().alias("top5_count"),
+        # How often was this peer in the top 5%? (percentile < 0.05, in integers)
+        (rank_0 * 20 < last_rank_0).sum().alias("top5_count"),
         # How often was this peer literally first?
         (pl.col("arrival_rank") == 1).sum().alias("first_count"),
     ).with_columns(
         (pl.col("top5_count") / pl.col("messages_seen") * 100).alias("top5_pct"),
         (pl.col("first_count") / pl.col("messages_seen") * 100).alias("first_pct"),
-    ).sort("avg_arrival_pct")
+        pl.col("recv_peer").cast(pl.String),
+    ).sort("avg_arrival_pct").collect(engine=SCORES_ENGINE)
 
-    print(f"    Aggregated {len(scores)} peers in {time.time()-t0:.1f}s")
+    print(f"    Scored {len(scores)} peers in {time.time()-t0:.1f}s")
     return scores
 
 
-def select_interesting_messages(timings: pl.DataFrame, metadata: pl.DataFrame, n: int = 200) -> list[int]:
+def select_interesting_messages(timings: pl.DataFrame, msg_types: pl.DataFrame, n: int = 200) -> pl.LazyFrame:
     """
     Select a diverse set of interesting messages for the wavefront viewer.
     Pick messages with high peer count (well-propagated) across all types.
+
+    Returns a lazy single-column `hash` frame so the wavefront and message
+    index plans can semi-join against it and be collected together.
     """
     # Count peers per message
-    msg_peer_counts = timings.group_by("hash").agg(
+    msg_peer_counts = timings.lazy().group_by("hash").agg(
         pl.len().alias("peer_count"),
-        pl.col("recv_timestamp").min().alias("first_seen"),
-        pl.col("recv_timestamp").max().alias("last_seen"),
+        pl.col("ts_ns").min().alias("first_seen"),
+        pl.col("ts_ns").max().alias("last_seen"),
     ).join(
-        metadata.select("hash", "type", "orig_node", "scid"),
+        msg_types.lazy(),
         on="hash",
         how="left",
     ).with_columns(
-        (pl.col("last_seen") - pl.col("first_seen")).dt.total_milliseconds().alias("spread_ms")
+        ((pl.col("last_seen") - pl.col("first_seen")) // 1_000_000).alias("spread_ms")
     ).filter(
         pl.col("peer_count") >= 50  # Only well-propagated messages
-    ).sort("peer_count", descending=True)
+    ).sort("hash")  # group_by order is arbitrary; fixes the ordinal tie-break below
 
-    selected = []
     # Take top messages per type
     per_type = n // 3
-    for msg_type in [1, 2, 3]:
-        type_msgs = msg_peer_counts.filter(pl.col("type") == msg_type)
-        # Mix: some with highest peer count, some with widest time spread
-        by_peers = type_msgs.sort("peer_count", descending=True).head(per_type // 2)
-        by_spread = type_msgs.sort("spread_ms", descending=True).head(per_type // 2)
-        combined = pl.concat([by_peers, by_spread]).unique(subset=["hash"])
-        selected.extend(combined["hash"].head(per_type).to_list())
-
-    return selected[:n]
+    # Mix: some with highest peer count, some with widest time spread
+    selected = msg_peer_counts.filter(pl.col("type").is_in([1, 2, 3])).with_columns(
+        pl.col("peer_count").rank("ordinal", descending=True).over("type").alias("r_peers"),
+        pl.col("spread_ms").rank("ordinal", descending=True).over("type").alias("r_spread"),
+    ).filter(
+        (pl.col("r_peers") <= per_type // 2) | (pl.col("r_spread") <= per_type // 2)
+    ).sort("type", "r_peers")
+
+    return selected.select("hash").head(n)
+
+
+def wavefront_plan(timings: pl.DataFrame, messages: pl.LazyFrame) -> pl.LazyFrame:
+    """Per selected message: arriving peers and delays (ms), in arrival order."""
+    return (
+        timings.lazy()
+        .join(messages, on="hash", how="semi")
+        .sort("hash", "ts_ns", "file_row")
+        .group_by("hash", maintain_order=True)
+        .agg(
+            pl.col("recv_peer").alias("peers"),
+            ((pl.col("ts_ns") - pl.col("ts_ns").first()) / 1_000_000)
+            .round(2)
+            .alias("delays"),
+            pl.len().alias("n"),
+        )
+        .filter(pl.col("n") >= 10)
+    )
 
 
-def build_wavefront_data(timings: pl.DataFrame, message_hashes: list[int]) -> dict:
+def build_wavefront_data(per_msg: pl.DataFrame) -> dict:
     """
     For each selected message, build the arrival sequence for animation.
     """
-    print(f"  Building wavefront data for {len(message_hashes)} messages...")
-    t0 = time.time()
-
-    subset = timings.filter(pl.col("hash").is_in(message_hashes))
-
     wavefronts = {}
-    for msg_hash in message_hashes:
-        msg_data = subset.filter(pl.col("hash") == msg_hash).sort("recv_timestamp")
-        if len(msg_data) < 10:
-            continue
-
-        first_ts = msg_data["recv_timestamp"].min()
-        arrivals = []
-        for row in msg_data.iter_rows(named=True):
-            delay_ms = (row["recv_timestamp"] - first_ts).total_seconds() * 1000
-            arrivals.append({
-                "peer": row["recv_peer"],
-                "delay_ms": round(delay_ms, 2),
-            })
-
+    for msg_hash, peers, delays, n in zip(*(per_msg[c].to_list() for c in per_msg.columns)):
         wavefronts[str(msg_hash)] = {
-            "arrivals": arrivals,
-            "total_peers": len(arrivals),
-            "spread_ms": arrivals[-1]["delay_ms"] if arrivals else 0,
+            "arrivals": [{"peer": p, "delay_ms": d} for p, d in zip(peers, delays)],
+            "total_peers": n,
+            "spread_ms": delays[-1],
         }
-
-    print(f"    Built {len(wavefronts)} wavefronts in {time.time()-t0:.1f}s")
     return wavefronts
 
 
@@ -287,52 +301,79 @@ def build_peer_data(
     node_map: dict,
 ) -> dict:
     """Build the per-peer JSON data for the frontend."""
-    peers = {}
-    for row in scores.iter_rows(named=True):
-        pubkey = row["recv_peer"]
-        node_info = node_map.get(pubkey, {})
-        alias = node_info.get("alias", "")
-        clearnet_ip = node_info.get("clearnet_ip")
-        is_tor = node_info.get("is_tor_only", True)
-
-        # Determine community
-        community = KNOWN_HUBS.get(pubkey, "unknown")
-
-        # LNT detection by alias
-        if community == "unknown" and alias:
-            alias_lower = alias.lower()
-            if "lnt." in alias_lower or "btclnt" in alias_lower:
-                community = "lnt_periphery"
-
-        peers[pubkey] = {
-            "alias": alias or pubkey[:16] + "…",
-            "ip": clearnet_ip,
+    nodes_df = pl.DataFrame(
+        {
+            "recv_peer": list(node_map),
+            "alias": [n["alias"] for n in node_map.values()],
+            "ip": [n["clearnet_ip"] for n in node_map.values()],
+            "is_tor": [n["is_tor_only"] for n in node_map.values()],
+        },
+        schema={"recv_peer": pl.String, "alias": pl.String, "ip": pl.String, "is_tor": pl.Boolean},
+    )
+    hubs_df = pl.DataFrame(
+        {"recv_peer": list(KNOWN_HUBS), "community": list(KNOWN_HUBS.values())},
+        schema={"recv_peer": pl.String, "community": pl.String},
+    )
+
+    alias = pl.col("alias")
+    peers_df = (
+        scores.join(nodes_df, on="recv_peer", how="left", maintain_order="left")
+        .join(hubs_df, on="recv_peer", how="left", maintain_order="left")
+        .select(
+            "recv_peer",
+            pl.when(alias.is_null() | (alias == ""))
+            .then(pl.col("recv_peer").str.slice(0, 16) + "…")
+            .otherwise(alias)
+            .alias("alias"),
+            "ip",
+            pl.col("is_tor").fill_null(True),
+            # Known hubs first, then LNT detection by alias
+            pl.col("community").fill_null(
+                pl.when(alias.str.to_lowercase().str.contains(r"lnt\.|btclnt"))
+                .then(pl.lit("lnt_periphery"))
+                .otherwise(pl.lit("unknown"))
+            ),
+            pl.col("avg_arrival_pct").round(4),
+            pl.col("median_arrival_pct").round(4),
+            "messages_seen",
+            pl.col("top5_pct").round(2),
+            pl.col("first_pct").round(2),
+        )
+    )
+
+    return {
+        pubkey: {
+            "alias": alias,
+            "ip": ip,
             "is_tor": is_tor,
             "community": community,
-            "avg_arrival_pct": round(row["avg_arrival_pct"], 4),
-            "median_arrival_pct": round(row["median_arrival_pct"], 4),
-            "messages_seen": row["messages_seen"],
-            "top5_pct": round(row["top5_pct"], 2),
-            "first_pct": round(row["first_pct"], 2),
+            "avg_arrival_pct": avg_pct,
+            "median_arrival_pct": median_pct,
+            "messages_seen": messages_seen,
+            "top5_pct": top5_pct,
+            "first_pct": first_pct,
         }
-
-    return peers
+        for pubkey, alias, ip, is_tor, community, avg_pct, median_pct, messages_seen, top5_pct, first_pct in zip(
+            *(peers_df[c].to_list() for c in peers_df.columns)
+        )
+    }
 
 
-def build_message_index(metadata: pl.DataFrame, message_hashes: list[int]) -> dict:
+def build_message_index(subset: pl.DataFrame) -> dict:
     """Build message metadata index for the frontend."""
-    subset = metadata.filter(pl.col("hash").is_in(message_hashes))
-    index = {}
-    for row in subset.iter_rows(named=True):
-        h = str(row["hash"])
-        index[h] = {
-            "type": MSG_TYPES.get(row["type"], "unknown"),
-            "type_id": row["type"],
-            "size": row["size"],
-            "orig_node": row["orig_node"],
-            "scid": str(row["scid"]) if row["scid"] else None,
+    hashes, types, sizes, orig_nodes, scids = (
+        subset[c].to_list() for c in ("hash", "type", "size", "orig_node", "scid")
+    )
+    return {
+        str(h): {
+            "type": MSG_TYPES.get(t, "unknown"),
+            "type_id": t,
+            "size": size,
+            "orig_node": orig_node,
+            "scid": str(scid) if scid else None,
         }
-    return index
+        for h, t, size, orig_node, scid in zip(hashes, types, sizes, orig_nodes, scids)
+    }
 
 
 def build_colocation_suspects(peers: dict) -> list:
@@ -342,36 +383,37 @@ def build_colocation_suspects(peers: dict) -> list:
     This is a coarse signal only: shared /24 can indicate common hosting or
     operator infrastructure, but it is not proof of common control.
     """
-    suspects = []
-
-    # Group by IP /24 prefix
-    ip_groups: dict[str, list] = {}
-    for pubkey, info in peers.items():
-        ip = info.get("ip")
-        if ip:
-            prefix = ".".join(ip.split(".")[:3])
-            ip_groups.setdefault(prefix, []).append(pubkey)
-
-    for prefix, group in ip_groups.items():
-        if len(group) >= 2:
-            suspects.append({
-                "type": "same_subnet",
-                "prefix": prefix + ".0/24",
-                "peers": [
-                    {
-                        "pubkey": p,
-                        "alias": peers[p]["alias"],
-                        "ip": peers[p]["ip"],
-                        "avg_arrival_pct": peers[p]["avg_arrival_pct"],
-                    }
-                    for p in group[:10]
-                ],
-                "count": len(group),
-            })
+    peers_df = pl.DataFrame(
+        {
+            "pubkey": list(peers),
+            "alias": [p["alias"] for p in peers.values()],
+            "ip": [p["ip"] for p in peers.values()],
+            "avg_arrival_pct": [p["avg_arrival_pct"] for p in peers.values()],
+        },
+        schema={"pubkey": pl.String, "alias": pl.String, "ip": pl.String, "avg_arrival_pct": pl.Float64},
+    )
 
-    # Sort by group size
-    suspects.sort(key=lambda x: x["count"], reverse=True)
-    return suspects[:50]
+    # Group by IP /24 prefix, keeping groups and members in peer order
+    suspects = (
+        peers_df.filter(pl.col("ip").is_not_null() & (pl.col("ip") != ""))
+        .with_columns(pl.col("ip").str.split(".").list.head(3).list.join(".").alias("prefix"))
+        .group_by("prefix", maintain_order=True)
+        .agg(
+            pl.struct("pubkey", "alias", "ip", "avg_arrival_pct").head(10).alias("peers"),
+            pl.len().alias("count"),
+        )
+        .filter(pl.col("count") >= 2)
+        # Sort by group size
+        .sort("count", descending=True, maintain_order=True)
+        .head(50)
+        .select(
+            pl.lit("same_subnet").alias("type"),
+            pl.col("prefix") + ".0/24",
+            "peers",
+            "count",
+        )
+    )
+    return suspects.to_dicts()
 
 
 def build_first_responder_leaks(peers: dict) -> list:
@@ -410,14 +452,37 @@ def main():
     # 1. Load raw data
     print("\n[1/7] Loading parquet data...")
     t0 = time.time()
-    timings = pl.read_parquet(str(PARQUET_DIR / "timings.parquet/"))
-    metadata = pl.read_parquet(str(PARQUET_DIR / "metadata.parquet/"))
-    print(f"  Loaded {len(timings):,} timing rows, {len(metadata):,} messages in {time.time()-t0:.1f}s")
+    metadata_lf = pl.scan_parquet(str(PARQUET_DIR / "metadata.parquet/")).select(
+        "hash", "type", "size", "orig_node", "scid"
+    )
+    # Arrival times as integer nanoseconds since the epoch; peers dictionary-
+    # encoded since each pubkey repeats across millions of rows. The streaming
+    # engine doesn't keep input order, so file_row carries it: it breaks
+    # equal-timestamp ties the way reading the files in order did.
+    timings_lf = pl.scan_parquet(str(PARQUET_DIR / "timings.parquet/"), row_index_name="file_row").select(
+        "file_row",
+        "hash",
+        pl.col("recv_peer").cast(pl.Categorical),
+        pl.col("recv_timestamp").dt.epoch("ns").alias("ts_ns"),
+    )
 
     # Filter to inbound gossip only (types 1,2,3)
-    gossip_hashes = set(metadata.filter(pl.col("type").is_in([1, 2, 3]))["hash"].to_list())
-    timings = timings.filter(pl.col("hash").is_in(gossip_hashes))
-    print(f"  Filtered to {len(timings):,} gossip timing rows")
+    gossip_lf = metadata_lf.filter(pl.col("type").is_in([1, 2, 3])).select("hash")
+    # One optimized plan for the timings, the message types and the summary's
+    # per-type counts so the metadata scan is shared. Only hash/type are kept
+    # in memory; the other metadata columns are read for the selected
+    # messages only, in step 5.
+    timings, msg_types, type_counts = pl.collect_all(
+        [
+            timings_lf.join(gossip_lf, on="hash", how="semi"),
+            metadata_lf.select("hash", "type"),
+            metadata_lf.group_by("type").len().sort("type"),
+        ],
+        engine="streaming",
+    )
+    # Diagnostics only take len() of collected frames. Sizing one of the lazy
+    # plans (scores, selection) would execute it a second time just to print.
+    print(f"  Loaded {len(timings):,} gossip timing rows, {len(msg_types):,} messages in {time.time()-t0:.1f}s")
 
     # 2. Load node data
     print("\n[2/7] Loading node data...")
@@ -439,11 +504,19 @@ def main():
 
     # 5. Select interesting messages and build wavefronts
     print("\n[5/7] Selecting interesting messages...")
-    interesting = select_interesting_messages(timings, metadata, n=200)
+    t0 = time.time()
+    # Selection, wavefronts and message index share one optimized plan
+    interesting_lf = select_interesting_messages(timings, msg_types, n=200)
+    interesting, per_msg, msg_subset = pl.collect_all([
+        interesting_lf,
+        wavefront_plan(timings, interesting_lf),
+        metadata_lf.join(interesting_lf, on="hash", how="semi"),
+    ])
     print(f"  Selected {len(interesting)} messages")
 
-    msg_index = build_message_index(metadata, interesting)
-    wavefronts = build_wavefront_data(timings, interesting)
+    msg_index = build_message_index(msg_subset)
+    wavefronts = build_wavefront_data(per_msg)
+    print(f"  Built {len(wavefronts)} wavefronts in {time.time()-t0:.1f}s")
 
     # 6. Detect privacy leaks
     print("\n[6/7] Detecting privacy leaks...")
@@ -455,32 +528,9 @@ def main():
     # 7. Write output
     print("\n[7/7] Writing output files...")
 
-    with open(OUTPUT_DIR / "peers.json", "w") as f:
-        json.dump(peers, f)
-    print(f"  peers.json ({len(peers)} peers)")
-
-    with open(OUTPUT_DIR / "wavefronts.json", "w") as f:
-        json.dump(wavefronts, f)
-    print(f"  wavefronts.json ({len(wavefronts)} messages)")
-
-    with open(OUTPUT_DIR / "messages.json", "w") as f:
-        json.dump(msg_index, f)
-    print(f"  messages.json ({len(msg_index)} messages)")
-
-    with open(OUTPUT_DIR / "communities.json", "w") as f:
-        json.dump(COMMUNITY_LABELS, f, indent=2)
-    print("  communities.json")
-
-    with open(OUTPUT_DIR / "leaks.json", "w") as f:
-        json.dump({
-            "colocation": colocation,
-            "first_responders": first_responders,
-        }, f)
-    print(f"  leaks.json ({len(colocation)} co-location signals (/24), {len(first_responders)} fast-relay heuristics)")
-
     # Summary stats for the frontend
     summary = {
-        "total_messages": len(metadata),
+        "total_messages": len(msg_types),
         "total_timing_rows": len(timings),
         "total_peers": len(peers),
         "peers_with_ip": sum(1 for p in peers.values() if p["ip"]),
@@ -488,13 +538,32 @@ def main():
         "collection_duration_hours": 23.5,
         "msg_types": {str(k): v for k, v in MSG_TYPES.items()},
         "msg_type_counts": {
-            MSG_TYPES[row["type"]]: row["len"]
-            for row in metadata.group_by("type").len().sort("type").iter_rows(named=True)
+            MSG_TYPES[t]: count
+            for t, count in type_counts.iter_rows()
         },
     }
-    with open(OUTPUT_DIR / "summary.json", "w") as f:
-        json.dump(summary, f, indent=2)
-    print("  summary.json")
+
+    # (file, object, indent, log line); the files are independent, so encode
+    # and flush them concurrently
+    outputs = [
+        ("peers.json", peers, False, f"peers.json ({len(peers)} peers)"),
+        ("wavefronts.json", wavefronts, False, f"wavefronts.json ({len(wavefronts)} messages)"),
+        ("messages.json", msg_index, False, f"messages.json ({len(msg_index)} messages)"),
+        ("communities.json", COMMUNITY_LABELS, True, "communities.json"),
+        ("leaks.json", {
+            "colocation": colocation,
+            "first_responders": first_responders,
+        }, False, f"leaks.json ({len(colocation)} co-location signals (/24), {len(first_responders)} fast-relay heuristics)"),
+        ("summary.json", summary, True, "summary.json"),
+    ]
+    with ThreadPoolExecutor(max_workers=JSON_WRITERS) as pool:
+        futures = [
+            pool.submit(write_json, OUTPUT_DIR / name, obj, indent, gz=True)
+            for name, obj, indent, _ in outputs
+        ]
+        for future, (_, _, _, note) in zip(futures, outputs):
+            future.result()
+            print(f"  {note}")
 
     print("\n" + "=" * 60)
     print("  Done! Output in:", OUTPUT_DIR)
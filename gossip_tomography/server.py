@@ -7,12 +7,28 @@ from flask import Flask, send_from_directory
 from flask_cors import CORS
 import os
 
+try:
+    from whitenoise import WhiteNoise
+except ImportError:
+    WhiteNoise = None
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 STATIC_DIR = os.path.join(BASE_DIR, "static")
 
 app = Flask(__name__, static_folder=STATIC_DIR)
 CORS(app)
 
+# WhiteNoise answers before Flask sees the request. It streams files with
+# sendfile and picks the precompressed .json.gz written next to each data file
+# when the client accepts gzip. Anything it can't find (or everything, without
+# whitenoise) falls through to the routes.
+# The pipeline rewrites static/data/ while the server runs (geolocate.py after
+# preprocess.py), so files are looked up on every request (autorefresh) rather
+# than indexed once, whose cached sizes and headers would go stale. max_age=0
+# makes browsers revalidate, getting a 304 until the data is regenerated.
+if WhiteNoise is not None:
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root=STATIC_DIR, index_file=True, autorefresh=True, max_age=0)
+
 
 @app.route("/")
 def index():